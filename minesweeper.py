@@ -1,6 +1,64 @@
 import itertools
 import random
-import copy
+from collections import defaultdict, deque
+from functools import lru_cache, reduce
+from operator import or_
+
+
+def cell_to_bit(i, j, width):
+    """
+    Returns the bit representing cell (i, j) in a board mask.
+    """
+    return 1 << (i * width + j)
+
+
+def mask_to_indices(mask):
+    """
+    Yields the flat index i * width + j of every cell whose bit is set in mask.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def mask_to_cells(mask, width):
+    """
+    Yields every (i, j) cell whose bit is set in mask.
+    """
+    for idx in mask_to_indices(mask):
+        yield divmod(idx, width)
+
+
+@lru_cache(maxsize=None)
+def neighbor_masks(height, width):
+    """
+    Returns a tuple indexed by i * width + j holding the mask
+    of the cells within one row and column of cell (i, j).
+    """
+    return tuple(
+        reduce(
+            or_,
+            (
+                cell_to_bit(ni, nj, width)
+                for ni in range(max(0, i - 1), min(height, i + 2))
+                for nj in range(max(0, j - 1), min(width, j + 2))
+                if (ni, nj) != (i, j)
+            ),
+            0,
+        )
+        for i in range(height)
+        for j in range(width)
+    )
+
+
+def random_member(cells):
+    """
+    Returns a random element of a non-empty set
+    without copying the set into a list.
+    """
+    return next(itertools.islice(cells, random.randrange(len(cells)), None))
+
 
 class Minesweeper():
     """
@@ -14,25 +72,28 @@ class Minesweeper():
         self.width = width
         self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        # Initialize an empty field with no mines,
+        # stored as one bit per cell
+        self.board_bits = 0
 
         # Add mines randomly
         while len(self.mines) != mines:
             i = random.randrange(height)
             j = random.randrange(width)
-            if not self.board[i][j]:
+            b = self._bit(i, j)
+            if not (self.board_bits & b):
+                self.board_bits |= b
                 self.mines.add((i, j))
-                self.board[i][j] = True
 
         # At first, player has found no mines
         self.mines_found = set()
 
+        # Mask of the in-bounds neighbors of every cell
+        self._nbr_mask = neighbor_masks(height, width)
+
+    def _bit(self, i, j):
+        return cell_to_bit(i, j, self.width)
+
     def print(self):
         """
         Prints a text-based representation
@@ -41,7 +102,7 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.board_bits & self._bit(i, j):
                     print("|X", end="")
                 else:
                     print("| ", end="")
@@ -50,7 +111,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.board_bits & self._bit(i, j))
 
     def nearby_mines(self, cell):
         """
@@ -59,23 +120,8 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        i, j = cell
+        return (self.board_bits & self._nbr_mask[i * self.width + j]).bit_count()
 
     def won(self):
         """
@@ -89,59 +135,119 @@ class Sentence():
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    The cells are stored as a bitmask with one bit per board cell,
+    so subset tests and differences are single integer operations.
+    cells may be given as (i, j) tuples or as such a mask, and width
+    is the width of the board, which maps one to the other.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    def __init__(self, cells, count, width):
+        self.width = width
+        if isinstance(cells, int):
+            self.cells_mask = cells
+        else:
+            self.cells_mask = 0
+            for i, j in cells:
+                #A j past the edge would alias a cell on the next row
+                if not 0 <= j < width:
+                    raise ValueError(f"Cell {(i, j)} is not on a board {width} cells wide")
+                self.cells_mask |= cell_to_bit(i, j, width)
         self.count = count
+        #Cache the number of cells so known_mines doesn't recount the mask
+        self._popcount = self.cells_mask.bit_count()
+
+    @property
+    def cells(self):
+        """
+        Returns the cells of the sentence as a set of (i, j) tuples.
+        """
+        return set(mask_to_cells(self.cells_mask, self.width))
 
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        return self.cells_mask == other.cells_mask and self.count == other.count
+
+    def __len__(self):
+        return self._popcount
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
     def known_mines(self):
         """
-        Returns the set of all cells in self.cells known to be mines.
+        Returns the mask of all cells in the sentence known to be mines.
         """
-        if len(self.cells) == self.count:
+        if self._popcount == self.count:
             #All cells are mines
-            return self.cells
+            return self.cells_mask
         else:
-            return None
+            return 0
 
     def known_safes(self):
         """
-        Returns the set of all cells in self.cells known to be safe.
+        Returns the mask of all cells in the sentence known to be safe.
         """
         if self.count == 0:
             #No mines in the current set of cells recorded by the sentence
-            return self.cells
+            return self.cells_mask
         else:
-            return None
+            return 0
       
+    def status(self):
+        """
+        Returns 'mine' if every cell in the sentence is a mine,
+        'safe' if every cell is safe, and None otherwise
+        (including when the sentence is empty).
+        """
+        if self.known_mines():
+            return "mine"
+        if self.known_safes():
+            return "safe"
+        return None
+
     def mark_mine(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
+        Returns the sentence's status afterwards, see status().
+        """
+        i, j = cell
+        return self._mark_mine(i * self.width + j)
+
+    def _mark_mine(self, idx):
+        """
+        mark_mine for the cell with flat index idx.
         """
         #If a cell is known to be a mine, remove that cell and decrease the count by one (as a mine has been taken out)
-        if cell in self.cells:
-            self.cells.remove(cell)
+        bit = 1 << idx
+        if self.cells_mask & bit:
+            self.cells_mask ^= bit
             self.count -= 1
+            self._popcount -= 1
+        return self.status()
 
 
     def mark_safe(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
+        Returns the sentence's status afterwards, see status().
+        """
+        i, j = cell
+        return self._mark_safe(i * self.width + j)
+
+    def _mark_safe(self, idx):
+        """
+        mark_safe for the cell with flat index idx.
         """
         #If a cell is safe, remove the cell from the sentence without decreasing the count
         #If this is the first time that a move is being made, dont remove it.
         # breakpoint()
-        if cell in self.cells:
-            self.cells.remove(cell)
+        bit = 1 << idx
+        if self.cells_mask & bit:
+            self.cells_mask ^= bit
+            self._popcount -= 1
+        return self.status()
 
 
 class MinesweeperAI():
@@ -149,12 +255,22 @@ class MinesweeperAI():
     Minesweeper game player
     """
 
-    def __init__(self, height=8, width=8):
+    def __init__(self, height=8, width=8, verbose=False):
 
         # Set initial height and width
         self.height = height
         self.width = width
 
+        # Print the AI's reasoning as it goes
+        self.verbose = verbose
+
+        # Mask of the cells within one row and column of each cell,
+        # shared by every AI and game on a board of this shape
+        self._nbr_mask = neighbor_masks(height, width)
+
+        # Cells that are neither moves already made nor known mines
+        self._available = set(range(height * width))
+
         # Keep track of which cells have been clicked on
         self.moves_made = set()
 
@@ -162,26 +278,158 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
+        # The same cells as flat indices i * width + j, which is how
+        # the AI works with cells internally, and as masks
+        self._moves_made = set()
+        self._mines = set()
+        self._safes = set()
+        self._mine_mask = 0
+        self._safe_mask = 0
+
+        # Safe cells that have not been chosen yet
+        self._unplayed_safes = set()
+
         # List of sentences about the game known to be true
         self.knowledge = []
 
+        # Number of sentences in self.knowledge that have become empty
+        self._empty_sentences = 0
+
+        # Sentences in the knowledge base that contain each cell
+        self._cell_to_sentences = defaultdict(list)
+
+        # Sentences in the knowledge base, keyed on cells_mask.
+        # Every sentence is true, so a mask always has the same count.
+        self._by_mask = {}
+
+        # Sentences that were added or changed and still need inference
+        self._dirty = deque()
+
+        # (subset mask, superset mask) pairs the subset rule was applied to
+        self._seen_pairs = set()
+
+        # Sentences found to be all mines or all safe, with that status,
+        # waiting for their cells to be marked
+        self._units = deque()
+        self._propagating = False
+
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        i, j = cell
+        self._mark_mine(i * self.width + j)
+
+    def _mark_mine(self, cell):
+        """
+        mark_mine for the cell with flat index cell.
+        """
+        self.mines.add(divmod(cell, self.width))
+        self._mines.add(cell)
+        self._mine_mask |= 1 << cell
+        self._available.discard(cell)
+        #A cell is only marked once, so its sentences can be dropped from the index
+        for sentence in self._cell_to_sentences.pop(cell, ()):
+            old_mask = sentence.cells_mask
+            was_resolved = sentence.status() is not None
+            self._sentence_changed(sentence, old_mask, sentence._mark_mine(cell), was_resolved)
+        self._propagate()
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+        i, j = cell
+        self._mark_safe(i * self.width + j)
+
+    def _mark_safe(self, cell):
+        """
+        mark_safe for the cell with flat index cell.
+        """
+        self.safes.add(divmod(cell, self.width))
+        self._safes.add(cell)
+        self._safe_mask |= 1 << cell
+        if cell not in self._moves_made:
+            self._unplayed_safes.add(cell)
+        for sentence in self._cell_to_sentences.pop(cell, ()):
+            old_mask = sentence.cells_mask
+            was_resolved = sentence.status() is not None
+            self._sentence_changed(sentence, old_mask, sentence._mark_safe(cell), was_resolved)
+        self._propagate()
+
+    def _add_sentence(self, sentence):
+        """
+        Adds a sentence to the knowledge base and queues it for inference.
+        If all of its cells are mines, or all are safe, they are marked
+        straight away and the sentence is not added.
+        """
+        if sentence.count == 0:
+            for cell in mask_to_indices(sentence.cells_mask):
+                self._mark_safe(cell)
+            return
+        if sentence.count == len(sentence):
+            for cell in mask_to_indices(sentence.cells_mask):
+                self._mark_mine(cell)
+            return
+
+        self._by_mask[sentence.cells_mask] = sentence
+        self.knowledge.append(sentence)
+        for cell in mask_to_indices(sentence.cells_mask):
+            self._cell_to_sentences[cell].append(sentence)
+        self._dirty.append(sentence)
+
+    def _sentence_changed(self, sentence, old_mask, status, was_resolved):
+        """
+        Indexes a sentence under its new cells_mask after it lost a cell,
+        in place of old_mask.
+        If status says it has just become all mines or all safe, queues it
+        to have its cells marked, and otherwise queues it for inference again.
+        A sentence that was already resolved is queued only once.
+        """
+        #old_mask has a marked cell in it, and no new sentence ever does,
+        #so it can't match again
+        if self._by_mask.get(old_mask) is sentence:
+            del self._by_mask[old_mask]
+        if not sentence.cells_mask:
+            #Left in self.knowledge until enough empty sentences pile up
+            self._empty_sentences += 1
+            return
+        self._by_mask.setdefault(sentence.cells_mask, sentence)
+        if was_resolved:
+            #Already waiting in self._units, or having its cells marked
+            return
+        if status is not None:
+            self._units.append((sentence, status))
+        else:
+            self._dirty.append(sentence)
+
+    def _propagate(self):
+        """
+        Marks the cells of every queued sentence that is all mines or
+        all safe, along with any sentences that resolves in turn.
+        """
+        #Marking a cell calls back in here; the outermost call does the work
+        if self._propagating:
+            return
+        self._propagating = True
+        units = self._units
+        try:
+            while units:
+                sentence, status = units.popleft()
+                if not sentence.cells_mask:
+                    continue
+                if self.verbose:
+                    print(f"Sentence {sentence} resolved, every cell is a {status}")
+                #mask_to_indices works on the mask as it is now, so marking cells can't disturb the loop
+                for cell in mask_to_indices(sentence.cells_mask):
+                    if status == "mine":
+                        self._mark_mine(cell)
+                    else:
+                        self._mark_safe(cell)
+        finally:
+            self._propagating = False
 
     def add_knowledge(self, cell, count):
         """
@@ -210,123 +458,105 @@ class MinesweeperAI():
 #Note that any time that you make any change to your AI’s knowledge, 
 # it may be possible to draw new inferences that weren’t possible before. 
 # Be sure that those new inferences are added to the knowledge base if it is possible to do so.
+        #Hot attributes as locals for the inference loop
+        knowledge = self.knowledge
+        width = self.width
+        by_mask = self._by_mask
+        seen_pairs = self._seen_pairs
+        dirty = self._dirty
+        verbose = self.verbose
+
         #1
         self.moves_made.add(cell)
 
+        #Work with the flat index of the cell
+        i, j = cell
+        cell = i * width + j
+        self._moves_made.add(cell)
+        self._available.discard(cell)
+        self._unplayed_safes.discard(cell)
+
         #2
-        self.mark_safe(cell)
+        self._mark_safe(cell)
 
         #3
-        neighboring_cells = set()
-        i,j = cell
-
-        for _i in range(i-1,i+2):
-            for _j in range(j-1,j+2):
-                if (_i,_j) == cell:
-                    #ignore
-                    continue
-
-                if (_i,_j) in self.safes:
-                    continue
-                
-                if (_i,_j) in self.mines:
-                    #already known to be mines, ignore
-                    count -= 1
-                    continue
-                if 0 <= _i < self.height and 0 <= _j < self.height:
-                    assert _i != 8, f"i is equal to 8 or above, OUT OF BOUNDS! _i = {_i}"
-                    assert _j != 8, f"j is equal to 8 or above, OUT OF BOUNDS! _j = {_j}"
-                    #If cell is in bounds
-                    neighboring_cells.add((_i,_j))
+        neighboring_mask = self._nbr_mask[cell]
+        #already known to be mines, ignore
+        count -= (neighboring_mask & self._mine_mask).bit_count()
+        neighboring_mask &= ~(self._mine_mask | self._safe_mask)
         #Create a new sentence
-        if neighboring_cells != set():
-            new_sentence = Sentence(neighboring_cells,count)
-            print(f"Created new sentence {{{new_sentence.cells}}} = {new_sentence.count}")
-            self.knowledge.append(new_sentence)
-        else:
-            print(f"Neighboring cells all in safes or mines, no new sentence created")
+        if neighboring_mask and neighboring_mask not in by_mask:
+            new_sentence = Sentence(neighboring_mask,count,width)
+            if verbose:
+                print(f"Created new sentence {{{new_sentence.cells}}} = {new_sentence.count}")
+            self._add_sentence(new_sentence)
+        elif verbose:
+            print(f"Neighboring cells all known or sentence already in KB, no new sentence created")
        
 
         #Consider the case of s1 - s2 = count1-count2
-        changed = True
+        #Only sentences that were added or changed can lead to new inferences,
+        #so work through those instead of rescanning the whole KB.
+        while dirty:
+            sentence = dirty.popleft()
+            mask = sentence.cells_mask
+            if not mask:
+                #Emptied after it was queued
+                continue
+            #Sentences that became all mines or all safe were already
+            #propagated by mark_mine/mark_safe, so only subsets are left
+
+            for other in knowledge:
+                other_mask = other.cells_mask
+                if other_mask == mask or not (other_mask & mask):
+                    #Only overlapping, distinct sentences can be subsets of each other
+                    continue
+                if (mask & other_mask) == mask:
+                    subset, superset = sentence, other
+                elif (mask & other_mask) == other_mask:
+                    subset, superset = other, sentence
+                else:
+                    continue
 
+                pair = (subset.cells_mask, superset.cells_mask)
+                if pair in seen_pairs:
+                    continue
+                seen_pairs.add(pair)
+
+                #subset is a non-empty strict subset of superset
+                resultant_mask = superset.cells_mask & ~subset.cells_mask
+                resultant_count = superset.count - subset.count
+                if verbose:
+                    print(f"Identified subset rule between sentence {subset} and sentence {superset}, new sentence {set(mask_to_cells(resultant_mask, width))} = {resultant_count} identified")
+
+                if resultant_mask not in by_mask:
+                    #New sentence has not been created before, so add it to the KB.
+                    new_sentence = Sentence(resultant_mask,resultant_count,width)
+                    self._add_sentence(new_sentence)
+                    if verbose:
+                        print(f"Inferred new sentence {new_sentence}")
+                    if sentence.cells_mask != mask:
+                        #Marking cells changed this sentence, and requeued it
+                        break
+
+        #remove empty sets once they make up a quarter of the KB
+        if self._empty_sentences * 4 > len(knowledge):
+            knowledge[:] = [sentence for sentence in knowledge if sentence.cells_mask]
+            self._empty_sentences = 0
 
-        while changed:
-            #Keep iterating until no further changes are made
-            if changed:
-                changed = False
-                
-                #If changed - loop through everything again and check.
-                for sentence in self.knowledge:
-                    if sentence.cells == set():
-                        print(f"Found empty sentence, continuing.")
-                        continue
-                    else:
-                        new_mines = sentence.known_mines()
-                        new_safes = sentence.known_safes()
-
-                        if new_mines is not None:
-                        #New mines found!
-                            assert new_mines != set(), f"new_mines {new_mines} is supposed to be a full set, but instead got empty set. Sentence is {{{sentence.cells}}} = {sentence.count}"
-                            print(f"New mines found: {new_mines}")
-                            for mine in new_mines.copy():
-                                #.copy() prevents RuntimeError: set size changed during iteration
-                                if mine not in self.mines:
-                                    print(f"While cleaning the knowledge base, found new mine {mine}!")
-                                    self.mark_mine(mine)
-                                    changed = True
-                                    print("Set changed to true")
-                        if new_safes is not None:
-                            assert new_safes != set(), f"new_safes {new_safes} is supposed to be a full set, but instead got empty set. Sentence is {{{sentence.cells}}} = {sentence.count}"
-                            print(f"new safes found: {new_safes}")
-                            for safe in new_safes.copy():
-                                if safe not in self.safes:
-                                    print(f"While cleaning the knowledge base, found new safe cell {safe}!")
-                                    self.mark_safe(safe)
-                                    changed = True
-                                    print("Set changed to true")
-                
-            for sentence_1 in self.knowledge:
-                for sentence_2 in self.knowledge:
-                    if sentence_1 == sentence_2:
-                        continue
-                    if sentence_1.cells == set() or sentence_2.cells == set():
-                        continue
-                    if sentence_1.cells.issubset(sentence_2.cells):
-                        #Ensure neither is an empty sentence
-                        assert sentence_1.cells != set(), f"Expected sentence 1 to be a set, instead got empty set {sentence_1.cells} with {sentence_1.count} - current KB is {self.knowledge}"
-                        assert sentence_2.cells != set(), f"Expected sentence 2 to be a set, instead got empty set {sentence_2.cells} with {sentence_2.count} - current KB is {self.knowledge}"
-
-                        #sentence 1 is a subset of sentence 2
-                        resultant_sentence = sentence_2.cells - sentence_1.cells
-                        resultant_count = sentence_2.count - sentence_1.count   
-                        new_sentence = Sentence(resultant_sentence,resultant_count)
-                        print(f"Identified subset rule between sentence {sentence_1} and sentence {sentence_2}, new sentence {new_sentence} identified")
-
-                        if new_sentence not in self.knowledge:
-                            assert new_sentence.cells != set(), f"Created new sentence that is an empty set"
-                            #New sentence has not been created before, so add it to the KB.
-                            self.knowledge.append(new_sentence)
-                            
-                            changed = True
-                            print(f"Added new sentence {new_sentence} to KB")
-                            print("Set changed to true")
-                        
-            #remove empty sets
-            empty = Sentence(set(),0)
-            self.knowledge[:] = [sentence for sentence in self.knowledge if sentence != empty]
-                
 
                 #Update information
         #mark any additional cells as safe or as mines if it can be concluded based on the AI's knowledge base
         
-        print(f"Moves made are {self.moves_made}")
-        print(f"{len(self.safes)} safe moves available - {self.safes}.")
-        print(f"There are {len(self.mines)} known mines - {self.mines}")
-        print(f"The AIs knowledge base is:")
-        for sentence in self.knowledge:
-            print(f"{{{sentence.cells}}} = {sentence.count}")
-        print("==================================================================================")
+        if verbose:
+            print(f"Moves made are {self.moves_made}")
+            print(f"{len(self.safes)} safe moves available - {self.safes}.")
+            print(f"There are {len(self.mines)} known mines - {self.mines}")
+            print(f"The AIs knowledge base is:")
+            for sentence in knowledge:
+                if sentence.cells_mask:
+                    print(f"{{{sentence.cells}}} = {sentence.count}")
+            print("==================================================================================")
         # breakpoint()
                 
 
@@ -344,12 +574,14 @@ class MinesweeperAI():
             The move returned must be known to be safe, and not a move already made.
             If no safe move can be guaranteed, the function should return None.
             The function should not modify self.moves_made, self.mines, self.safes, or self.knowledge."""
-        #Eliminate moves already made
-        safes = self.safes - self.moves_made
+        #Moves already made are taken out of self._unplayed_safes as they happen
+        safes = self._unplayed_safes
         if safes:
-            print("Making safe move - {} safe moves availible".format(len(safes)))
-            move = random.choice(list(safes))
-            print(f"Made safe move {move}")
+            if self.verbose:
+                print("Making safe move - {} safe moves availible".format(len(safes)))
+            move = divmod(random_member(safes), self.width)
+            if self.verbose:
+                print(f"Made safe move {move}")
             return move
         else:
             return None
@@ -361,19 +593,17 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        #Make sure the move is actually availible
-        all_cells = set((i,j) for i in range(self.height) for j in range(self.width))
-        _ =  all_cells - self.mines
-        #use _ as a garbage variable - personal preference
-        available_cells = _ - self.moves_made
-
-        if available_cells == set():
+        #Cells already chosen or known to be mines are taken out of
+        #self._available as that happens, so it is always up to date
+        if not self._available:
             #No moves can be made!
-            print(f"No random moves possible!")
+            if self.verbose:
+                print(f"No random moves possible!")
             return None
         else:
-            random_move = random.choice(list(available_cells))
-            print(f"Making random move - {random_move}!")
+            random_move = divmod(random_member(self._available), self.width)
+            if self.verbose:
+                print(f"Making random move - {random_move}!")
             return random_move
 
 
@@ -0,0 +1,100 @@
+import random
+import unittest
+
+from minesweeper import Minesweeper, MinesweeperAI
+
+
+class ReferenceAI():
+    """
+    The subset-rule AI with plain sets of (i, j) cells,
+    run to a fixed point after every move.
+    """
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.mines = set()
+        self.safes = set()
+        # (frozenset of cells, count) pairs
+        self.knowledge = set()
+
+    def add_knowledge(self, cell, count):
+        self.safes.add(cell)
+        i, j = cell
+        cells = frozenset(
+            (ni, nj)
+            for ni in range(max(0, i - 1), min(self.height, i + 2))
+            for nj in range(max(0, j - 1), min(self.width, j + 2))
+            if (ni, nj) != cell
+        )
+        self.knowledge.add((cells, count))
+
+        while True:
+            # Take known cells out of every sentence
+            knowledge = set()
+            for cells, count in self.knowledge:
+                count -= len(cells & self.mines)
+                cells = cells - self.mines - self.safes
+                if cells:
+                    knowledge.add((cells, count))
+
+            known = len(self.mines) + len(self.safes)
+            for cells, count in knowledge:
+                if count == 0:
+                    self.safes |= cells
+                elif count == len(cells):
+                    self.mines |= cells
+
+            for subset, subset_count in list(knowledge):
+                for superset, superset_count in list(knowledge):
+                    if subset < superset:
+                        knowledge.add((superset - subset, superset_count - subset_count))
+
+            if known == len(self.mines) + len(self.safes) and knowledge == self.knowledge:
+                return
+            self.knowledge = knowledge
+
+
+class TestMinesweeperAI(unittest.TestCase):
+
+    def play(self, seed, height, width, mines):
+        """
+        Plays one seeded game with MinesweeperAI choosing the moves,
+        feeding every move to ReferenceAI as well, and checks the
+        AI's knowledge after each one.
+        """
+        random.seed(seed)
+        game = Minesweeper(height=height, width=width, mines=mines)
+        ai = MinesweeperAI(height=height, width=width)
+        reference = ReferenceAI(height, width)
+
+        while True:
+            move = ai.make_safe_move()
+            if move is None:
+                move = ai.make_random_move()
+            if move is None or game.is_mine(move):
+                return
+            count = game.nearby_mines(move)
+            ai.add_knowledge(move, count)
+            reference.add_knowledge(move, count)
+
+            # Sound: every mine is a mine and every safe cell is safe
+            self.assertLessEqual(ai.mines, game.mines)
+            self.assertFalse(ai.safes & game.mines)
+            # Knows at least as much as the reference
+            self.assertLessEqual(reference.mines, ai.mines)
+            self.assertLessEqual(reference.safes, ai.safes)
+
+    def test_8x8(self):
+        for seed in range(200):
+            with self.subTest(seed=seed):
+                self.play(seed, 8, 8, 8)
+
+    def test_rectangular_board(self):
+        for seed in range(50):
+            with self.subTest(seed=seed):
+                self.play(seed, 10, 14, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()